@@ -4,33 +4,33 @@ import os
 import logging
 import requests
 import gzip
+import pickle
+import shutil
 import xml.etree.ElementTree as ET
-from io import BytesIO
+from collections import OrderedDict
 from Components.ActionMap import ActionMap
 from Components.MenuList import MenuList
 from Components.Pixmap import Pixmap
 from Screens.Screen import Screen
 from Plugins.Plugin import PluginDescriptor
 from Tools.LoadPixmap import LoadPixmap
-import datetime
+from functools import lru_cache
+from operator import attrgetter
+import bisect
+import calendar
+import email.utils
 import time
-import subprocess
+import sys
+import tempfile
+import threading
+from twisted.internet import reactor
 
-# Try to import lxml, install if not available
+# Prefer lxml, fall back to the bundled ElementTree parser
 try:
     from lxml import etree
     LXML_AVAILABLE = True
 except ImportError:
     LXML_AVAILABLE = False
-    logging.getLogger("CiefpTvTodayDE").warning("lxml module not found, attempting to install...")
-    try:
-        subprocess.run(["pip3", "install", "lxml"], check=True, capture_output=True, text=True)
-        from lxml import etree
-        LXML_AVAILABLE = True
-        logging.getLogger("CiefpTvTodayDE").info("Successfully installed lxml")
-    except Exception as e:
-        logging.getLogger("CiefpTvTodayDE").error(f"Failed to install lxml: {str(e)}. Falling back to ElementTree")
-        LXML_AVAILABLE = False
 
 PLUGIN_PATH = "/usr/lib/enigma2/python/Plugins/Extensions/CiefpTvTodayDE"
 EPG_DIR = "/tmp/CiefpTvTodayDE"
@@ -38,6 +38,14 @@ PICON_DIR = os.path.join(PLUGIN_PATH, "picon")
 PLACEHOLDER_PICON = os.path.join(PLUGIN_PATH, "placeholder.png")
 EPG_URL = "https://epgshare01.online/epgshare01/epg_ripper_DE1.xml.gz"
 CACHE_TIME = 86400  # 24 hours caching
+EPG_LINES_CACHE_SIZE = 64  # channels whose formatted EPG is kept in memory
+PICON_CACHE_SIZE = 24  # decoded picons kept in memory (~116 KB each at 220x132)
+LOAD_DESC = True  # keep programme descriptions; they are most of the EPG's text
+SNAPSHOT_VERSION = 5  # bump whenever channel or Programme fields change
+
+# Closing the screen doesn't stop its loader, so a reopened screen must wait
+# for it instead of writing the same cache files alongside it
+_load_lock = threading.Lock()
 
 # Configure logging for picons and critical errors only
 logging.getLogger('').handlers = []
@@ -54,8 +62,47 @@ logging.basicConfig(
 logger = logging.getLogger("CiefpTvTodayDE")
 logger.debug("Initializing CiefpTvTodayDE logger")
 
+class _CleanNameTable(dict):
+    # str.translate() table keeping alphanumerics and '.', filled in lazily per code point
+    # so non-ASCII letters (e.g. "cnntürk.png") survive like they did with isalnum()
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        value = self[codepoint] = char if char.isalnum() or char == '.' else None
+        return value
+
+_CLEAN_NAME_TABLE = _CleanNameTable()
+
+@lru_cache(maxsize=4096)
 def clean_channel_name(name):
-    return ''.join(e.lower() if e.isalnum() or e == '.' else '' for e in name).strip()
+    return name.translate(_CLEAN_NAME_TABLE).lower()
+
+def parse_epg_time(value):
+    # XMLTV times are fixed "YYYYmmddHHMMSS +hhmm"; slicing is far cheaper than strptime
+    stamp, _, offset = value.partition(' ')
+    timestamp = calendar.timegm((int(stamp[0:4]), int(stamp[4:6]), int(stamp[6:8]),
+                                 int(stamp[8:10]), int(stamp[10:12]), int(stamp[12:14]), 0, 0, 0))
+    if len(offset) == 5 and offset[0] in '+-':
+        delta = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        timestamp = timestamp - delta if offset[0] == '+' else timestamp + delta
+    return timestamp
+
+class Programme(object):
+    __slots__ = ('start_ts', 'stop_ts', 'start_date', 'title', 'display')
+
+    def __init__(self, start_ts, stop_ts, title, desc, category):
+        self.start_ts = start_ts
+        self.stop_ts = stop_ts
+        # Date and time both in box-local time so headers and HH:MM agree;
+        # dates repeat across thousands of programmes, so share one copy each
+        local_time = time.localtime(start_ts)
+        self.start_date = sys.intern(time.strftime('%Y%m%d', local_time))
+        hhmm = time.strftime('%H:%M', local_time)
+        self.title = title
+        # The EPG line never changes after parsing, so build it once here
+        # instead of keeping desc/category around and formatting on every render
+        self.display = f"{hhmm} - {title} ({category})"
+        if desc:
+            self.display += f"\n  {desc}"
 
 class CiefpTvTodayDE(Screen):
     skin = """
@@ -88,10 +135,16 @@ class CiefpTvTodayDE(Screen):
 
         self.currentView = "channels"
         self.epgData = {}
+        self._epgStarts = {}
         self.channelData = []
+        self._channelById = {}
+        self._epgLinesCache = OrderedDict()
         self.epgLines = []
+        self._epgIndexMap = {}
         self.epgScrollPos = 0
         self.focus_on_channels = True
+        self.epgReady = False
+        self.closed = False
 
         for directory in [EPG_DIR, PICON_DIR]:
             if not os.path.exists(directory):
@@ -101,22 +154,76 @@ class CiefpTvTodayDE(Screen):
                     logger.error(f"Error creating directory {directory}: {str(e)}")
                     self["epgInfo"].setList([f"Error: {str(e)}"])
 
+        # Older versions cached the inflated XML (tens of MB on RAM-backed /tmp)
+        legacy_cache = os.path.join(EPG_DIR, "epg_cache.xml")
+        if os.path.exists(legacy_cache):
+            try:
+                os.remove(legacy_cache)
+            except Exception as e:
+                logger.error(f"Error removing old cache {legacy_cache}: {str(e)}")
+
+        # Index the picon directory once so channel changes don't stat() every candidate
+        try:
+            self._piconFiles = set(os.listdir(PICON_DIR))
+        except Exception as e:
+            logger.error(f"Error listing picon directory {PICON_DIR}: {str(e)}")
+            self._piconFiles = set()
+        self._piconCache = OrderedDict()
+        self._placeholderPixmap = None
+
         self.onLayoutFinish.append(self.loadPluginLogo)
         self.onLayoutFinish.append(self.loadBackgroundLogo)
         self.onLayoutFinish.append(self.loadSideBackground)
         self.onLayoutFinish.append(self.downloadAndParseData)
 
     def downloadAndParseData(self):
-        cache_file = os.path.join(EPG_DIR, "epg_cache.xml")
-        
-        if os.path.exists(cache_file) and (time.time() - os.path.getmtime(cache_file)) < CACHE_TIME:
-            try:
-                with open(cache_file, 'r') as f:
-                    xml_data = f.read()
-                self.parseXMLData(xml_data)
-                return
-            except Exception as e:
-                logger.error(f"Error reading cache: {str(e)}")
+        # Download and parsing run in a worker thread so the UI stays responsive;
+        # widgets are only touched again from onEPGLoaded() on the main thread
+        self.epgReady = False
+        self["epgInfo"].setList(["Loading EPG data..."])
+        threading.Thread(target=self._loadInBackground, daemon=True).start()
+
+    def _loadInBackground(self):
+        # Always report back, otherwise the screen would sit on "Loading EPG data..." forever
+        try:
+            with _load_lock:
+                if self.closed:
+                    return  # nobody left to report to
+                result = self.loadEPGData()
+        except Exception as e:
+            logger.error(f"Error loading EPG data: {str(e)}")
+            result = (f"Error: {str(e)}", None)
+        reactor.callFromThread(self.onEPGLoaded, result)
+
+    def onEPGLoaded(self, result):
+        if self.closed:
+            return
+        if result:
+            epg_message, channel_message = result
+            self["epgInfo"].setList([epg_message])
+            if channel_message:
+                self["channelList"].setList([channel_message])
+            return
+        self.epgReady = True
+        self.showChannels()
+
+    def loadEPGData(self):
+        cache_file = os.path.join(EPG_DIR, "epg_cache.xml.gz")
+        snapshot_file = os.path.join(EPG_DIR, "epg_cache.pkl")
+        lastmod_file = os.path.join(EPG_DIR, "epg_cache.lastmod")
+
+        cache_fresh = os.path.exists(cache_file) and (time.time() - os.path.getmtime(cache_file)) < CACHE_TIME
+
+        # The snapshot is only as fresh as the cache it was parsed from
+        if cache_fresh and self.snapshotMatchesCache(snapshot_file, cache_file):
+            if self.loadSnapshot(snapshot_file):
+                return None
+
+        if cache_fresh:
+            if self.parseCache(cache_file, snapshot_file) is None:
+                return None
+            # A truncated download or an error page must not stick for CACHE_TIME: fetch a new one
+            self.discardCache(cache_file, snapshot_file, lastmod_file)
 
         try:
             headers = {
@@ -125,151 +232,312 @@ class CiefpTvTodayDE(Screen):
                 "Accept-Encoding": "gzip, deflate",
                 "Accept-Language": "en-US,en;q=0.5"
             }
-            response = requests.get(EPG_URL, headers=headers, timeout=30)
-            response.raise_for_status()
+            # Ask the server to skip the body only when our expired cache is known to parse;
+            # epg_cache.lastmod is written after a successful parse and dropped with a broken cache
+            last_modified = self.readLastModified(lastmod_file) if os.path.exists(cache_file) else None
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+            result, not_modified = self.downloadEPGData(headers, cache_file, snapshot_file, lastmod_file)
+            if result and not_modified:
+                # The cache the server vouched for is unreadable after all: fetch it in full, once
+                headers.pop("If-Modified-Since", None)
+                result, not_modified = self.downloadEPGData(headers, cache_file, snapshot_file, lastmod_file)
+            return result
 
-            with gzip.GzipFile(fileobj=BytesIO(response.content)) as gz:
-                xml_data = gz.read().decode('utf-8')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Network error: {str(e)}")
+            return (f"Network error: {str(e)}", None)
+        except Exception as e:
+            logger.error(f"General error: {str(e)}")
+            return (f"Error: {str(e)}", None)
+
+    def downloadEPGData(self, headers, cache_file, snapshot_file, lastmod_file):
+        # Returns the parse result and whether the server reported our cache unchanged
+        not_modified = False
+        cache_saved = True
+        # Store the gzip file as served (about a tenth of the XML size on flash)
+        # and inflate it while parsing, so no full XML copy is ever in memory
+        with requests.get(EPG_URL, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304 and "If-Modified-Since" in headers and os.path.exists(cache_file):
+                # Unchanged upstream: restart the cache period and reuse what we have
+                not_modified = True
+                snapshot_valid = self.snapshotMatchesCache(snapshot_file, cache_file)
+                os.utime(cache_file, None)
+                if snapshot_valid:
+                    os.utime(snapshot_file, None)
+                    if self.loadSnapshot(snapshot_file):
+                        return None, not_modified
+            else:
+                response.raise_for_status()
+                self.discardCache(snapshot_file, lastmod_file)
+                response.raw.decode_content = True
+                cache_saved = self.saveCache(response.raw, cache_file)
+                last_modified = response.headers.get("Last-Modified")
+
+        if not cache_saved:
+            # A full /tmp must not cost the user the EPG: parse straight from the network,
+            # on a new connection once the half-read one above is closed
+            headers.pop("If-Modified-Since", None)
+            return self.parseFromNetwork(headers), not_modified
+
+        result = self.parseCache(cache_file, snapshot_file)
+        if result:
+            self.discardCache(cache_file, snapshot_file, lastmod_file)
+        elif not not_modified:
+            self.saveLastModified(lastmod_file, last_modified or email.utils.formatdate(os.path.getmtime(cache_file), usegmt=True))
+        return result, not_modified
+
+    def parseCache(self, cache_file, snapshot_file):
+        try:
+            with gzip.open(cache_file, 'rb') as f:
+                return self.parseXMLData(f, snapshot_file)
+        except Exception as e:
+            logger.error(f"Error reading cache: {str(e)}")
+            return (f"Error reading cache: {str(e)}", None)
 
+    def discardCache(self, *cache_files):
+        for cache_file in cache_files:
             try:
-                with open(cache_file, 'w') as f:
-                    f.write(xml_data)
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
             except Exception as e:
-                logger.error(f"Error saving cache: {str(e)}")
+                logger.error(f"Error removing cache {cache_file}: {str(e)}")
 
-            self.parseXMLData(xml_data)
+    def snapshotMatchesCache(self, snapshot_file, cache_file):
+        # A snapshot older than the cache belongs to an earlier download
+        try:
+            return os.path.getmtime(snapshot_file) >= os.path.getmtime(cache_file)
+        except OSError:
+            return False
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error: {str(e)}")
-            self["epgInfo"].setList([f"Network error: {str(e)}"])
-        except Exception as e:
-            logger.error(f"General error: {str(e)}")
-            self["epgInfo"].setList([f"Error: {str(e)}"])
+    def saveCache(self, stream, cache_file):
+        tmp_file = None
+        try:
+            fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_file))
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            os.chmod(tmp_file, 0o644)  # mkstemp() creates 0600, keep the cache readable as before
+            os.replace(tmp_file, cache_file)
+            return True
+        except OSError as e:
+            logger.error(f"Error saving cache: {str(e)}")
+            return False
+        finally:
+            if tmp_file and os.path.exists(tmp_file):
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+
+    def parseFromNetwork(self, headers):
+        with requests.get(EPG_URL, headers=headers, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with gzip.GzipFile(fileobj=response.raw) as gz:
+                return self.parseXMLData(gz)
 
-    def parseXMLData(self, xml_data):
+    def readLastModified(self, lastmod_file):
         try:
-            if LXML_AVAILABLE:
-                parser = etree.XMLParser(encoding='utf-8', recover=True)
-                tree = etree.fromstring(xml_data.encode('utf-8'), parser=parser)
-                channel_iter = tree.xpath('//channel')
-                program_iter = tree.xpath('//programme')
-            else:
-                tree = ET.fromstring(xml_data)
-                channel_iter = tree.findall('.//channel')
-                program_iter = tree.findall('.//programme')
+            with open(lastmod_file, 'r') as f:
+                return f.read().strip() or None
+        except Exception:
+            return None
+
+    def saveLastModified(self, lastmod_file, last_modified):
+        try:
+            if last_modified:
+                with open(lastmod_file, 'w') as f:
+                    f.write(last_modified)
+            elif os.path.exists(lastmod_file):
+                os.remove(lastmod_file)
+        except Exception as e:
+            logger.error(f"Error saving Last-Modified: {str(e)}")
 
+    def parseXMLData(self, fileobj, snapshot_file=None):
+        try:
             self.channelData = []
+            self._channelById = {}
             self.epgData = {}
+            self._epgLinesCache.clear()
 
-            for channel in channel_iter:
-                channel_id = channel.get('id')
-                display_name = channel.find('display-name') if not LXML_AVAILABLE else channel.xpath('display-name[1]/text()')
-                icon = channel.find('icon') if not LXML_AVAILABLE else channel.xpath('icon[1]/@src')
+            self._parseXMLStream(fileobj)
+            for programmes in self.epgData.values():
+                programmes.sort(key=attrgetter('start_ts'))
+            self._buildStartIndex()
 
-                if not channel_id or display_name is None:
-                    continue
-
-                channel_name = display_name.text.strip() if not LXML_AVAILABLE else display_name[0].strip()
-                self.channelData.append({
-                    "id": channel_id,
-                    "title": channel_name,
-                    "alias": clean_channel_name(channel_name),
-                    "logo": f"{clean_channel_name(channel_name)}.png",
-                    "icon": icon.get('src') if icon is not None and not LXML_AVAILABLE else (icon[0] if icon else None)
-                })
-                self.epgData[channel_name] = []
-
-            if not self.channelData:
-                self["epgInfo"].setList(["No channels found in EPG data"])
-                self["channelList"].setList(["No channels available"])
-                return
-
-            self["channelList"].setList([ch["title"] for ch in self.channelData])
-
-            for program in program_iter:
-                channel_id = program.get('channel')
-                start_time = program.get('start')
-                stop_time = program.get('stop')
-                title = program.find('title') if not LXML_AVAILABLE else program.xpath('title[1]/text()')
-                desc = program.find('desc') if not LXML_AVAILABLE else program.xpath('desc[1]/text()')
-                category = program.find('category') if not LXML_AVAILABLE else program.xpath('category[1]/text()')
-                icon = program.find('icon') if not LXML_AVAILABLE else program.xpath('icon[1]/@src')
-
-                if not (channel_id and start_time and (title is not None if not LXML_AVAILABLE else title)):
-                    continue
+            if snapshot_file and self.channelData:
+                self.saveSnapshot(snapshot_file)
+            return None
 
-                channel = next((ch for ch in self.channelData if ch['id'] == channel_id), None)
-                if not channel:
-                    continue
+        except Exception as e:
+            logger.error(f"XML parsing error: {str(e)}")
+            self.channelData = []
+            self._channelById = {}
+            return (f"Error parsing EPG data: {str(e)}", "Error loading channels")
 
-                channel_name = channel['title']
-                program_data = {
-                    'title': title.text.strip() if not LXML_AVAILABLE else (title[0].strip() if title else "Nepoznat naslov"),
-                    'desc': desc.text.strip() if desc is not None and not LXML_AVAILABLE else (desc[0].strip() if desc else "Nema opisa"),
-                    'category': category.text.strip() if category is not None and not LXML_AVAILABLE else (category[0].strip() if category else ""),
-                    'icon': icon.get('src') if icon is not None and not LXML_AVAILABLE else (icon[0] if icon else None)
-                }
+    def showChannels(self):
+        if not self.channelData:
+            self["epgInfo"].setList(["No channels found in EPG data"])
+            self["channelList"].setList(["No channels available"])
+            return
 
-                try:
-                    time_str = start_time.split(' ')[0]
-                    time_obj = datetime.datetime.strptime(time_str, '%Y%m%d%H%M%S')
-                    start_timestamp = int(time_obj.timestamp())
-                    if stop_time:
-                        stop_time_str = stop_time.split(' ')[0]
-                        stop_time_obj = datetime.datetime.strptime(stop_time_str, '%Y%m%d%H%M%S')
-                        program_data['stop_timestamp'] = int(stop_time_obj.timestamp())
-                    else:
-                        program_data['stop_timestamp'] = None
-                    program_data['start_timestamp'] = start_timestamp
-                    program_data['start_date'] = time_obj.strftime('%Y%m%d')
-                    self.epgData[channel_name].append(program_data)
-                except ValueError as e:
-                    logger.error(f"Time parsing error for program {title.text if not LXML_AVAILABLE else (title[0] if title else 'unknown')}: {str(e)}")
-                    continue
+        self["channelList"].setList([ch["title"] for ch in self.channelData])
+        self.updateEPGAndPicon()
 
-            self.updateEPGAndPicon()
+    def saveSnapshot(self, snapshot_file):
+        # Keep the parsed result so a warm start can skip XML parsing entirely
+        try:
+            with open(snapshot_file, 'wb') as f:
+                pickle.dump({
+                    "version": SNAPSHOT_VERSION,
+                    "channels": self.channelData,
+                    "epg": self.epgData
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.error(f"Error saving EPG snapshot: {str(e)}")
 
+    def loadSnapshot(self, snapshot_file):
+        try:
+            with open(snapshot_file, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                return False
+            self.channelData = snapshot["channels"]
+            self.epgData = snapshot["epg"]
         except Exception as e:
-            logger.error(f"XML parsing error: {str(e)}")
-            self["epgInfo"].setList([f"Error parsing EPG data: {str(e)}"])
-            self["channelList"].setList(["Error loading channels"])
+            logger.error(f"Error reading EPG snapshot: {str(e)}")
+            return False
+
+        self._channelById = {}
+        for channel in self.channelData:
+            self._channelById.setdefault(channel["id"], channel)
+        self._buildStartIndex()
+        self._epgLinesCache.clear()
+        return True
+
+    def _buildStartIndex(self):
+        # Start times per channel, in list order, for bisect lookups of the running programme
+        self._epgStarts = {channel_id: [p.start_ts for p in programmes] for channel_id, programmes in self.epgData.items()}
+
+    def _parseXMLStream(self, fileobj):
+        # Handle each <channel>/<programme> as soon as it is closed and drop it
+        # right away, so the whole EPG document is never held in memory.
+        root = None
+        if LXML_AVAILABLE:
+            context = etree.iterparse(fileobj, events=("end",), tag=("channel", "programme"), recover=True)
+        else:
+            # ElementTree has no getparent(), so grab the root from its start event
+            context = ET.iterparse(fileobj, events=("start", "end"))
+
+        for event, elem in context:
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "channel":
+                self._addChannel(elem)
+            elif elem.tag == "programme":
+                self._addProgramme(elem)
+            else:
+                continue
+
+            elem.clear()
+            if LXML_AVAILABLE:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            else:
+                root.clear()
+        del context
+
+    def _addChannel(self, channel):
+        channel_id = channel.get('id')
+        channel_name = (channel.findtext('display-name') or '').strip()
+
+        if not channel_id or not channel_name:
+            return
+
+        channel_id = sys.intern(channel_id)
+
+        alias = clean_channel_name(channel_name)
+        channel_entry = {
+            "id": channel_id,
+            "title": channel_name,
+            "alias": alias,
+            "logo": f"{alias}.png"
+        }
+        self.channelData.append(channel_entry)
+        self._channelById.setdefault(channel_id, channel_entry)
+        self.epgData.setdefault(channel_id, [])
+
+    def _addProgramme(self, program):
+        channel_id = program.get('channel')
+        start_time = program.get('start')
+        stop_time = program.get('stop')
+        title = program.findtext('title')
+        desc = program.findtext('desc') if LOAD_DESC else None
+        category = program.findtext('category')
+
+        if not (channel_id and start_time and title):
+            return
+
+        if channel_id not in self._channelById:
+            return
 
-    def getEPGFromData(self, channel_name):
-        epglist = self.epgData.get(channel_name, [])
+        try:
+            start_timestamp = parse_epg_time(start_time)
+            stop_timestamp = parse_epg_time(stop_time) if stop_time else None
+            self.epgData[channel_id].append(Programme(
+                start_timestamp,
+                stop_timestamp,
+                title.strip(),
+                desc.strip() if desc else ("Nema opisa" if LOAD_DESC else ""),
+                category.strip() if category else ""
+            ))
+        except ValueError as e:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Time parsing error for program %s: %s", title, e)
+
+    def getEPGFromData(self, channel):
+        cached = self._epgLinesCache.get(channel["id"])
+        if cached is not None:
+            self._epgLinesCache.move_to_end(channel["id"])
+            return cached
+
+        cached = self._buildEPGLines(channel)
+        self._epgLinesCache[channel["id"]] = cached
+        if len(self._epgLinesCache) > EPG_LINES_CACHE_SIZE:
+            self._epgLinesCache.popitem(last=False)
+        return cached
+
+    def _buildEPGLines(self, channel):
+        epglist = self.epgData.get(channel["id"], [])
         if not epglist:
-            return [f"No EPG data for channel: {channel_name}"]
+            return [f"No EPG data for channel: {channel['title']}"], {}
 
         epg_by_date = {}
-        for program in sorted(epglist, key=lambda x: x['start_timestamp']):
-            try:
-                date_str = program['start_date']
-                date_formatted = datetime.datetime.fromtimestamp(program['start_timestamp']).strftime('%d.%m.%Y')
-                time_str = datetime.datetime.fromtimestamp(program['start_timestamp']).strftime('%H:%M')
-                entry = f"{time_str} - {program['title']} ({program['category']})"
-                if program['desc']:
-                    entry += f"\n  {program['desc']}"
-                if date_str not in epg_by_date:
-                    epg_by_date[date_str] = []
-                epg_by_date[date_str].append(entry)
-            except ValueError as e:
-                logger.error(f"Time formatting error for program {program['title']}: {str(e)}")
-                continue
+        for program in epglist:
+            date_str = program.start_date
+            if date_str not in epg_by_date:
+                epg_by_date[date_str] = []
+            epg_by_date[date_str].append(program)
 
+        # Remember the line of every programme so the screen can jump to it directly
         result = []
+        index_map = {}
         for date_str in sorted(epg_by_date.keys()):
-            date_formatted = datetime.datetime.strptime(date_str, '%Y%m%d').strftime('%d.%m.%Y')
+            date_formatted = f"{date_str[6:8]}.{date_str[4:6]}.{date_str[0:4]}"
             result.append(f"--- {date_formatted} ---")
-            result.extend(epg_by_date[date_str])
+            for program in epg_by_date[date_str]:
+                index_map[(program.title, program.start_ts)] = len(result)
+                result.append(program.display)
         
         if not result:
-            return [f"No valid EPG data for channel: {channel_name}"]
-        return result
+            return [f"No valid EPG data for channel: {channel['title']}"], {}
+        return result, index_map
 
-    def loadPicon(self, channel_name):
-        channel = next((ch for ch in self.channelData if ch["title"] == channel_name), None)
-        if not channel:
-            logger.error(f"No channel data found for channel: {channel_name}")
-            return
+    def loadPicon(self, channel):
+        channel_name = channel["title"]
 
         possible_picon_names = [
             channel["logo"],
@@ -282,122 +550,96 @@ class CiefpTvTodayDE(Screen):
         found_picon = False
 
         for picon_name in possible_picon_names:
-            filename = os.path.join(PICON_DIR, picon_name)
-            if os.path.exists(filename):
+            if picon_name not in self._piconFiles:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Picon not found: %s", os.path.join(PICON_DIR, picon_name))
+                continue
+            pixmap = self._piconCache.get(picon_name)
+            if pixmap is not None:
+                self._piconCache.move_to_end(picon_name)
+            else:
+                filename = os.path.join(PICON_DIR, picon_name)
                 try:
                     pixmap = LoadPixmap(filename)
-                    found_picon = True
-                    break
                 except Exception as e:
                     logger.error(f"Error loading picon {filename}: {str(e)}")
-            else:
-                logger.error(f"Picon not found: {filename}")
+                    continue
+                if pixmap:
+                    self._piconCache[picon_name] = pixmap
+                    if len(self._piconCache) > PICON_CACHE_SIZE:
+                        self._piconCache.popitem(last=False)
+            found_picon = True
+            break
 
         if not found_picon:
-            logger.error(f"No picon found for channel '{channel_name}'. Tried: {', '.join(possible_picon_names)}. Using placeholder.")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("No picon found for channel '%s'. Tried: %s. Using placeholder.", channel_name, ", ".join(possible_picon_names))
+            pixmap = self.getPlaceholderPixmap()
+
+        if pixmap and self["picon"].instance:
+            try:
+                self["picon"].instance.setPixmap(pixmap)
+            except Exception as e:
+                logger.error(f"Error setting picon for channel {channel_name}: {str(e)}")
+
+    def getPlaceholderPixmap(self):
+        if self._placeholderPixmap is None:
             if os.path.exists(PLACEHOLDER_PICON):
                 try:
-                    pixmap = LoadPixmap(PLACEHOLDER_PICON)
+                    self._placeholderPixmap = LoadPixmap(PLACEHOLDER_PICON)
                 except Exception as e:
                     logger.error(f"Error loading placeholder picon {PLACEHOLDER_PICON}: {str(e)}")
             else:
                 logger.error(f"Placeholder picon not found: {PLACEHOLDER_PICON}")
+        return self._placeholderPixmap
 
-        if pixmap and self["picon"].instance:
-            try:
-                self["picon"].instance.setPixmap(pixmap)
-            except Exception as e:
-                logger.error(f"Error setting picon for channel {channel_name}: {str(e)}")
+    def getCurrentChannel(self):
+        index = self["channelList"].getSelectionIndex()
+        if 0 <= index < len(self.channelData):
+            return self.channelData[index]
+        return None
 
     def updateEPGAndPicon(self):
-        current = self["channelList"].getCurrent()
-        if current:
-            channel_name = current
-            self.epgLines = self.getEPGFromData(channel_name)
+        if not self.epgReady:
+            return
+        channel = self.getCurrentChannel()
+        if channel:
+            channel_id = channel["id"]
+            self.epgLines, self._epgIndexMap = self.getEPGFromData(channel)
             if self.epgLines:
                 self["epgInfo"].setList(self.epgLines)
                 
                 # Find current program
                 now = time.time()  # Current time in seconds since epoch
-                current_date = datetime.datetime.now().strftime('%Y%m%d')
                 current_index = 0
-                found_current = False
 
-                # Iterate through epgData to find the current program
+                # The running programme is the latest one that started before now
+                programmes = self.epgData.get(channel_id, [])
                 current_program = None
-                min_time_diff = float('inf')
-                for program in sorted(self.epgData.get(channel_name, []), key=lambda x: x['start_timestamp']):
-                    start_time = program['start_timestamp']
-                    stop_time = program['stop_timestamp']
-                    program_date = program['start_date']
-                    if stop_time and program_date == current_date and start_time <= now <= stop_time:
-                        # Current program is active
-                        time_diff = abs(now - start_time)
-                        if time_diff < min_time_diff:
-                            min_time_diff = time_diff
-                            current_program = program
+                idx = bisect.bisect_right(self._epgStarts.get(channel_id, []), now) - 1
+                if idx >= 0:
+                    candidate = programmes[idx]
+                    if candidate.stop_ts and candidate.stop_ts >= now:
+                        current_program = candidate
 
-                if current_program:
-                    # Find the index in epgLines that matches the current program
-                    for i, line in enumerate(self.epgLines):
-                        if line.startswith("---") or "No EPG data" in line or "No valid EPG data" in line:
-                            continue
-                        if " - " not in line:
-                            continue
-                        try:
-                            time_str = line.split(" - ")[0]
-                            title = line.split(" - ")[1].split(" (")[0]
-                            if title == current_program['title']:
-                                line_time = datetime.datetime.strptime(
-                                    f"{datetime.datetime.fromtimestamp(current_program['start_timestamp']).strftime('%d.%m.%Y')} {time_str}",
-                                    "%d.%m.%Y %H:%M"
-                                ).timestamp()
-                                if abs(line_time - current_program['start_timestamp']) < 60:  # Allow 1-minute tolerance
-                                    current_index = i
-                                    found_current = True
-                                    break
-                        except (IndexError, ValueError):
-                            continue
-
-                if not found_current:
+                if not current_program:
                     # Find the first program for the current or future date
-                    future_programs = [p for p in self.epgData.get(channel_name, []) if p['start_date'] >= current_date]
-                    if future_programs:
-                        first_future = min(future_programs, key=lambda x: x['start_timestamp'])
-                        for i, line in enumerate(self.epgLines):
-                            if line.startswith("---") or "No EPG data" in line or "No valid EPG data" in line:
-                                continue
-                            if " - " not in line:
-                                continue
-                            try:
-                                time_str = line.split(" - ")[0]
-                                title = line.split(" - ")[1].split(" (")[0]
-                                if title == first_future['title']:
-                                    line_time = datetime.datetime.strptime(
-                                        f"{datetime.datetime.fromtimestamp(first_future['start_timestamp']).strftime('%d.%m.%Y')} {time_str}",
-                                        "%d.%m.%Y %H:%M"
-                                    ).timestamp()
-                                    if abs(line_time - first_future['start_timestamp']) < 60:
-                                        current_index = i
-                                        break
-                            except (IndexError, ValueError):
-                                continue
-                    else:
-                        # If no future programs, select the last valid program
-                        for i, line in reversed(list(enumerate(self.epgLines))):
-                            if line.startswith("---") or "No EPG data" in line or "No valid EPG data" in line:
-                                continue
-                            if " - " not in line:
-                                continue
-                            current_index = i
-                            break
+                    # Programmes are sorted by start time, so the first match is the earliest
+                    current_date = time.strftime('%Y%m%d', time.localtime(now))
+                    current_program = next((p for p in programmes if p.start_date >= current_date), None)
+
+                if current_program:
+                    current_index = self._epgIndexMap.get((current_program.title, current_program.start_ts), 0)
+                elif self._epgIndexMap:
+                    # If no future programs, select the last valid program
+                    current_index = max(self._epgIndexMap.values())
                 
                 self.epgScrollPos = current_index
                 self["epgInfo"].moveToIndex(self.epgScrollPos)
                 if not self.focus_on_channels:
                     self["epgInfo"].instance.setSelectionEnable(True)
             
-            self.loadPicon(channel_name)
+            self.loadPicon(channel)
         else:
             self["epgInfo"].setList(["Select a channel to view EPG"])
 
@@ -410,6 +652,7 @@ class CiefpTvTodayDE(Screen):
         self.updateEPGAndPicon()
 
     def exit(self):
+        self.closed = True
         self.close()
 
     def up(self):